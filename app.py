@@ -1,25 +1,71 @@
 import os
 import re
 import requests
-import pandas as pd
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import streamlit as st
 from pathlib import Path
 import base64
+import hashlib
 import zipfile
-from io import BytesIO
-import subprocess
 import tempfile
 import shutil
 import json
+import orjson
+import sqlite3
 import time
+import threading
+import queue
+from collections import deque
+from contextlib import closing
+from itertools import chain
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait, as_completed
+from functools import partial
 from mutagen.mp4 import MP4, MP4Cover
-from mutagen.id3 import ID3, APIC, TIT2, TPE1, TALB
-from mutagen.mp3 import MP3
+from PIL import Image
+from mutagen.id3 import ID3, ID3NoHeaderError, APIC, TIT2, TPE1, TALB
+
+try:
+    from yt_dlp import YoutubeDL
+    from yt_dlp.utils import DownloadCancelled, DownloadError, match_filter_func
+except ImportError:
+    YoutubeDL = None
 
 # ---------------- CONFIG ----------------
 SPOTIFY_CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
 SPOTIFY_CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET")
 
+# Persistent caches shared across sessions
+CACHE_DIR = Path.home() / ".cache" / "playlistpilot"
+RESOLVE_CACHE_PATH = CACHE_DIR / "resolved.sqlite3"
+COVER_CACHE_DIR = CACHE_DIR / "covers"
+COVER_CACHE_MAX_BYTES = 200 * 1024 * 1024
+# Longest side, in pixels, of embedded covers unless full resolution is requested
+COVER_MAX_SIZE = 500
+TRACK_CACHE_DIR = CACHE_DIR / "tracks"
+TRACK_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+
+@st.cache_resource(show_spinner=False)
+def get_session():
+    """Return the HTTP session shared by every rerun and session of this process.
+
+    Spotify API and cover CDN calls reuse its pooled keep-alive connections;
+    pool_maxsize covers the 16 cover-fetch workers.
+    """
+    session = requests.Session()
+    for scheme in ("https://", "http://"):
+        session.mount(scheme, HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=32,
+            max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 502, 503, 504],
+                              raise_on_status=False)
+        ))
+    session.headers.update({"User-Agent": "PlaylistPilot/1.0"})
+    return session
+
+
 st.set_page_config(page_title="Spotify Playlist Downloader", layout="wide")
 st.title("🎵 Spotify Playlist & Track Downloader")
 
@@ -32,15 +78,24 @@ Download your favorite Spotify playlists or individual songs with **album covers
 
 
 # Check installations
+@st.cache_resource
 def check_ytdlp():
-    try:
-        result = subprocess.run(['yt-dlp', '--version'], capture_output=True, text=True, timeout=5)
-        return result.returncode == 0
-    except:
-        return False
+    return YoutubeDL is not None
+
+
+@st.cache_resource
+def check_aria2c():
+    return shutil.which('aria2c') is not None
+
+
+@st.cache_resource
+def check_ffmpeg():
+    return shutil.which('ffmpeg') is not None
 
 
 ytdlp_installed = check_ytdlp()
+aria2c_installed = check_aria2c()
+ffmpeg_installed = check_ffmpeg()
 
 if not ytdlp_installed:
     st.error("⚠️ yt-dlp is not installed! Please run: `pip install yt-dlp mutagen`")
@@ -59,8 +114,38 @@ with st.expander("⚙️ Download Settings"):
         ["m4a", "mp3"],
         help="m4a: No FFmpeg needed. mp3: Requires FFmpeg but more compatible."
     )
+    if audio_format == "mp3" and not ffmpeg_installed:
+        st.warning("⚠️ FFmpeg was not found; mp3 conversion will fail. Install FFmpeg or choose m4a.")
     audio_quality = st.selectbox("Quality", ["best", "192", "128"], index=0)
     add_metadata = st.checkbox("Add album covers & metadata", value=True)
+    full_res_covers = st.checkbox(
+        "Full-resolution album covers",
+        value=False,
+        disabled=not add_metadata,
+        help=f"By default covers are scaled down to {COVER_MAX_SIZE}px, which keeps every file in an album smaller."
+    )
+    cover_size = None if full_res_covers else COVER_MAX_SIZE
+    max_workers = st.slider(
+        "Concurrent downloads",
+        1, 16, 8,
+        help="Number of tracks downloaded in parallel. Lower this if sources start throttling."
+    )
+    concurrent_fragments = st.slider(
+        "Fragments per track",
+        1, 8, 4,
+        help="Number of stream fragments each download fetches in parallel."
+    )
+    use_aria2c = st.checkbox(
+        "Use aria2c downloader",
+        value=False,
+        disabled=not aria2c_installed,
+        help="Download with aria2c using 16 connections per file. Requires aria2c on the PATH."
+    )
+    compress_zip = st.checkbox(
+        "Compress ZIP (slower)",
+        value=False,
+        help="Audio is already compressed, so this rarely makes the ZIP noticeably smaller."
+    )
 
 col1, col2 = st.columns(2)
 with col1:
@@ -68,12 +153,13 @@ with col1:
 with col2:
     download_btn = st.button("⬇️ Download All", use_container_width=True, type="primary")
 
-log_area = st.empty()
-progress_bar = st.progress(0)
 status_text = st.empty()
 
 
 # ---------------- Spotify API Functions ----------------
+# Client-credentials tokens live for an hour and are not user-specific, so one
+# cached token serves every session until shortly before it expires.
+@st.cache_data(ttl=3300, show_spinner=False)
 def get_spotify_token(client_id, client_secret):
     """Get Spotify API access token."""
     auth_url = "https://accounts.spotify.com/api/token"
@@ -85,70 +171,86 @@ def get_spotify_token(client_id, client_secret):
     }
     data = {"grant_type": "client_credentials"}
 
-    response = requests.post(auth_url, headers=headers, data=data)
+    response = get_session().post(auth_url, headers=headers, data=data)
     response.raise_for_status()
-    return response.json()["access_token"]
+    return orjson.loads(response.content)["access_token"]
+
+
+_SPOTIFY_URL_RE = re.compile(r'(playlist|track)/([a-zA-Z0-9]+)')
+
+# Only request the playlist fields the app reads; full objects include large
+# lists such as available_markets for every track.
+_SPOTIFY_ITEM_FIELDS = (
+    "items(track(id,name,duration_ms,external_ids(isrc),external_urls(spotify),album(name,images(url)),artists(name)))"
+)
+_SPOTIFY_PLAYLIST_FIELDS = f"name,owner(display_name),tracks(total,limit,{_SPOTIFY_ITEM_FIELDS})"
 
 
 def extract_spotify_id(url):
     """Extract playlist or track ID from Spotify URL."""
-    playlist_match = re.search(r'playlist/([a-zA-Z0-9]+)', url)
-    if playlist_match:
-        return 'playlist', playlist_match.group(1)
-
-    track_match = re.search(r'track/([a-zA-Z0-9]+)', url)
-    if track_match:
-        return 'track', track_match.group(1)
+    match = _SPOTIFY_URL_RE.search(url)
+    if match:
+        return match.group(1), match.group(2)
 
     return None, None
 
 
-def fetch_spotify_playlist(playlist_id, token):
-    """Fetch playlist data from Spotify API."""
+def fetch_spotify_playlist_page(playlist_id, token, offset, limit=100):
+    """Fetch one page of playlist tracks from Spotify API."""
+    headers = {"Authorization": f"Bearer {token}"}
+    url = f"https://api.spotify.com/v1/playlists/{playlist_id}/tracks"
+    params = {"offset": offset, "limit": limit, "fields": _SPOTIFY_ITEM_FIELDS}
+
+    response = get_session().get(url, headers=headers, params=params)
+    response.raise_for_status()
+    return orjson.loads(response.content)
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def fetch_spotify_playlist(playlist_id, token, max_workers=5):
+    """Fetch playlist data from Spotify API, including every page of tracks."""
     headers = {"Authorization": f"Bearer {token}"}
     url = f"https://api.spotify.com/v1/playlists/{playlist_id}"
+    params = {"fields": _SPOTIFY_PLAYLIST_FIELDS}
 
-    response = requests.get(url, headers=headers)
+    response = get_session().get(url, headers=headers, params=params)
     response.raise_for_status()
-    return response.json()
+    playlist_data = orjson.loads(response.content)
+
+    # The playlist object only embeds the first page of tracks; once the total
+    # is known the remaining offsets are fetched in parallel.
+    tracks = playlist_data.get("tracks", {})
+    total = tracks.get("total", 0)
+    limit = tracks.get("limit") or 100
+    offsets = range(limit, total, limit)
+
+    if offsets:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pages = executor.map(
+                lambda offset: fetch_spotify_playlist_page(playlist_id, token, offset, limit),
+                offsets
+            )
+            for page in pages:
+                tracks["items"].extend(page.get("items", []))
 
+    return playlist_data
 
+
+@st.cache_data(ttl=600, show_spinner=False)
 def fetch_spotify_track(track_id, token):
     """Fetch single track data from Spotify API."""
     headers = {"Authorization": f"Bearer {token}"}
     url = f"https://api.spotify.com/v1/tracks/{track_id}"
 
-    response = requests.get(url, headers=headers)
+    response = get_session().get(url, headers=headers)
     response.raise_for_status()
-    return response.json()
+    return orjson.loads(response.content)
 
 
 def extract_tracks_from_spotify(playlist_data):
     """Extract track information from Spotify playlist."""
-    tracks = []
     items = playlist_data.get("tracks", {}).get("items", [])
-
-    for item in items:
-        track = item.get("track")
-        if not track:
-            continue
-
-        album = track.get("album", {})
-        images = album.get("images", [])
-        cover_url = images[0]["url"] if images else None
-
-        track_info = {
-            "id": track.get("id"),
-            "name": track.get("name"),
-            "artists": ", ".join([a["name"] for a in track.get("artists", [])]),
-            "album": album.get("name", ""),
-            "duration_ms": track.get("duration_ms"),
-            "spotify_url": track.get("external_urls", {}).get("spotify", ""),
-            "cover_url": cover_url,
-        }
-        tracks.append(track_info)
-
-    return tracks
+    return [extract_single_track_info(item["track"]) for item in items if item.get("track")]
 
 
 def extract_single_track_info(track_data):
@@ -160,9 +262,10 @@ def extract_single_track_info(track_data):
     track_info = {
         "id": track_data.get("id"),
         "name": track_data.get("name"),
-        "artists": ", ".join([a["name"] for a in track_data.get("artists", [])]),
+        "artists": ", ".join(a["name"] for a in track_data.get("artists", [])),
         "album": album.get("name", ""),
         "duration_ms": track_data.get("duration_ms"),
+        "isrc": track_data.get("external_ids", {}).get("isrc"),
         "spotify_url": track_data.get("external_urls", {}).get("spotify", ""),
         "cover_url": cover_url,
     }
@@ -170,15 +273,81 @@ def extract_single_track_info(track_data):
     return track_info
 
 
-def download_cover_art(cover_url):
-    """Download album cover from URL."""
+def tracks_for_display(tracks):
+    """Build the track table as a dict of columns, one list per displayed field."""
+    return {col: [t[col] for t in tracks] for col in ("name", "artists", "album")}
+
+
+def shrink_cover(cover_data, max_size):
+    """Scale a cover down to fit in ``max_size`` pixels as a JPEG.
+
+    Covers that are already small enough, or that cannot be decoded, are
+    returned unchanged.
+    """
+    try:
+        with Image.open(BytesIO(cover_data)) as img:
+            if max(img.size) <= max_size:
+                return cover_data
+            img.thumbnail((max_size, max_size), Image.LANCZOS)
+            out = BytesIO()
+            img.convert("RGB").save(out, "JPEG", quality=85, optimize=True)
+            return out.getvalue()
+    except (OSError, ValueError):
+        return cover_data
+
+
+def download_cover_art(cover_url, max_size=None):
+    """Download album cover from URL, reusing the on-disk copy if there is one.
+
+    With ``max_size`` the cover is scaled down once, before it is cached.
+    """
+    # Cover URLs point at immutable images, so the URL alone is a safe cache key
+    cache_name = hashlib.sha256(cover_url.encode()).hexdigest()[:32]
+    if max_size:
+        cache_name += f"-{max_size}"
+    cache_path = COVER_CACHE_DIR / f"{cache_name}.jpg"
     try:
-        response = requests.get(cover_url, timeout=10)
+        cover_data = cache_path.read_bytes()
+        # Bump the mtime so prune_cache_dir sees the cover as recently used
+        os.utime(cache_path)
+        return cover_data
+    except OSError:
+        pass
+
+    try:
+        response = get_session().get(cover_url, timeout=10)
         response.raise_for_status()
-        return response.content
+        cover_data = response.content
     except:
         return None
 
+    if max_size:
+        cover_data = shrink_cover(cover_data, max_size)
+
+    try:
+        COVER_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        # Write under a temporary name so concurrent readers never see a partial image
+        tmp = tempfile.NamedTemporaryFile(dir=COVER_CACHE_DIR, delete=False)
+    except OSError:
+        return cover_data
+    try:
+        with tmp:
+            tmp.write(cover_data)
+        os.replace(tmp.name, cache_path)
+    except OSError:
+        # The temporary name has no .jpg suffix, so pruning would never remove it
+        try:
+            os.remove(tmp.name)
+        except OSError:
+            pass
+
+    return cover_data
+
+
+def tag_padding(info):
+    """Write tags in place when they fit the existing padding, else reserve 1 KiB for later edits."""
+    return info.padding if info.padding >= 0 else 1024
+
 
 def add_metadata_to_file(file_path, track_info, cover_data):
     """Add metadata and album cover to audio file."""
@@ -192,22 +361,21 @@ def add_metadata_to_file(file_path, track_info, cover_data):
             if cover_data:
                 audio["covr"] = [MP4Cover(cover_data, imageformat=MP4Cover.FORMAT_JPEG)]
 
-            audio.save()
+            audio.save(padding=tag_padding)
 
         elif file_path.endswith('.mp3'):
-            audio = MP3(file_path, ID3=ID3)
-
+            # Load only the ID3 header; the MPEG stream does not need to be parsed
             try:
-                audio.add_tags()
-            except:
-                pass
+                tags = ID3(file_path)
+            except ID3NoHeaderError:
+                tags = ID3()
 
-            audio.tags.add(TIT2(encoding=3, text=track_info["name"]))
-            audio.tags.add(TPE1(encoding=3, text=track_info["artists"]))
-            audio.tags.add(TALB(encoding=3, text=track_info["album"]))
+            tags.add(TIT2(encoding=3, text=track_info["name"]))
+            tags.add(TPE1(encoding=3, text=track_info["artists"]))
+            tags.add(TALB(encoding=3, text=track_info["album"]))
 
             if cover_data:
-                audio.tags.add(
+                tags.add(
                     APIC(
                         encoding=3,
                         mime='image/jpeg',
@@ -217,29 +385,416 @@ def add_metadata_to_file(file_path, track_info, cover_data):
                     )
                 )
 
-            audio.save()
+            tags.save(file_path, padding=tag_padding)
 
         return True
     except Exception as e:
         return False
 
 
+def prune_cache_dir(cache_dir, max_bytes, suffixes):
+    """Delete the least recently used cached files until ``cache_dir`` fits in ``max_bytes``.
+
+    Only files ending in one of ``suffixes`` are counted, so in-progress
+    temporary files are left alone. Cache hits bump a file's mtime.
+    """
+    try:
+        with os.scandir(cache_dir) as it:
+            entries = [(e.stat().st_mtime, e.stat().st_size, e.path) for e in it if e.name.endswith(suffixes)]
+    except OSError:
+        return
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+class CoverFetcher:
+    """Fetches album covers on a shared pool, reusing fetches that are still running."""
+
+    def __init__(self, max_workers):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.lock = threading.Lock()
+        self.futures = {}
+
+    def fetch(self, url, max_size=None):
+        """Return a future for the cover at ``url``, joining an in-flight fetch if there is one."""
+        key = (url, max_size)
+        with self.lock:
+            future = self.futures.get(key)
+            if future is not None:
+                return future
+            future = self.executor.submit(download_cover_art, url, max_size)
+            self.futures[key] = future
+        # Finished covers are on disk, so later fetches are cheap cache hits
+        future.add_done_callback(partial(self._forget, key))
+        return future
+
+    def _forget(self, key, future):
+        with self.lock:
+            if self.futures.get(key) is future:
+                del self.futures[key]
+
+
+@st.cache_resource(show_spinner=False)
+def get_cover_fetcher():
+    """Return the process-wide cover fetcher shared by every rerun and session."""
+    return CoverFetcher(max_workers=16)
+
+
+def warm_cover_cache(tracks, cover_size=None):
+    """Start fetching the tracks' distinct album covers into the disk cache.
+
+    Returns immediately; the fetches finish in the background while the user
+    reviews the track list, and a download started meanwhile picks up the same
+    futures instead of fetching the covers again.
+    """
+    fetcher = get_cover_fetcher()
+    for url in {t["cover_url"] for t in tracks if t.get("cover_url")}:
+        fetcher.fetch(url, cover_size)
+
+
+def tag_track(file_path, track_info, cover_future=None):
+    """Write a track's metadata into the file, waiting for its album cover if one is being fetched."""
+    cover_data = cover_future.result() if cover_future else None
+    return add_metadata_to_file(file_path, track_info, cover_data)
+
+
+# Anything but letters, digits, spaces, '-' and '_' is dropped from archive names
+_UNSAFE_ARCHIVE_CHARS_RE = re.compile(r'[^\w \-]')
+
+# Characters that are invalid in filenames on at least one common OS
+_INVALID_FILENAME_CHARS = str.maketrans('', '', '<>:"/\\|?*')
+
+
 def clean_filename(text):
     """Clean filename by removing invalid characters."""
-    return re.sub(r'[<>:"/\\|?*]', '', text)
+    return text.translate(_INVALID_FILENAME_CHARS)
+
 
+def file_exists_in_dir(output_dir, base_filename, extensions, existing_names=None):
+    """Check if file already exists with any of the given extensions.
 
-def file_exists_in_dir(output_dir, base_filename, extensions):
-    """Check if file already exists with any of the given extensions."""
+    ``existing_names``, if given, is a set of the directory's file names that
+    is checked instead of the filesystem.
+    """
     for ext in extensions:
-        file_path = os.path.join(output_dir, f"{base_filename}.{ext}")
-        if os.path.exists(file_path):
+        file_name = f"{base_filename}.{ext}"
+        file_path = os.path.join(output_dir, file_name)
+        if existing_names is not None:
+            found = file_name in existing_names
+        else:
+            found = os.path.exists(file_path)
+        if found:
             return True, file_path
     return False, None
 
 
+def write_zip_entry(zip_file, file_path, arcname, chunk_size=1024 * 1024):
+    """Add a file to an open ZIP, copying in large chunks.
+
+    ZipFile.write copies through an 8 KiB buffer; audio files are several MB,
+    so a bigger buffer cuts the number of read/write calls per entry.
+    """
+    zinfo = zipfile.ZipInfo.from_file(file_path, arcname)
+    zinfo.compress_type = zip_file.compression
+    with open(file_path, 'rb') as src, zip_file.open(zinfo, 'w') as dest:
+        shutil.copyfileobj(src, dest, chunk_size)
+
+
+# ---------------- Resolve Cache ----------------
+def resolve_cache_key(track_info):
+    """Key a track by the fields that identify the same recording.
+
+    The ISRC names the recording itself, so it is preferred when Spotify
+    provides one; otherwise artist, title and length stand in for it.
+    """
+    if track_info.get("isrc"):
+        return f"isrc:{track_info['isrc']}"
+    return f"{track_info['artists']}||{track_info['name']}||{track_info.get('duration_ms')}"
+
+
+def connect_resolve_cache():
+    """Open the search-result cache, creating it on first use."""
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(RESOLVE_CACHE_PATH, timeout=10)
+    conn.execute("CREATE TABLE IF NOT EXISTS resolved (key TEXT PRIMARY KEY, url TEXT NOT NULL, source TEXT NOT NULL)")
+    return conn
+
+
+def get_resolved_source(track_info):
+    """Return the cached (url, source name) for a track, or None."""
+    try:
+        with closing(connect_resolve_cache()) as conn:
+            return conn.execute(
+                "SELECT url, source FROM resolved WHERE key = ?", (resolve_cache_key(track_info),)
+            ).fetchone()
+    except (sqlite3.Error, OSError):
+        return None
+
+
+def store_resolved_source(track_info, url, source_name):
+    """Remember which URL a track's search resolved to."""
+    try:
+        with closing(connect_resolve_cache()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO resolved (key, url, source) VALUES (?, ?, ?)",
+                (resolve_cache_key(track_info), url, source_name)
+            )
+    except (sqlite3.Error, OSError):
+        pass
+
+
+# ---------------- Track Cache ----------------
+TRACK_CACHE_SUFFIXES = (".m4a", ".mp3", ".webm", ".opus")
+
+
+def track_cache_stem(track_info, audio_format, quality):
+    """Path, without extension, of a track's cached audio for the given output settings."""
+    key = hashlib.sha1(f"{resolve_cache_key(track_info)}\0{audio_format}\0{quality}".encode()).hexdigest()
+    return TRACK_CACHE_DIR / key
+
+
+def copy_cached_track(track_info, audio_format, quality, output_stem):
+    """Copy a track downloaded by an earlier run to ``output_stem``; return its path, or None."""
+    cache_stem = track_cache_stem(track_info, audio_format, quality)
+    for suffix in TRACK_CACHE_SUFFIXES:
+        cached_file = f"{cache_stem}{suffix}"
+        output_file = f"{output_stem}{suffix}"
+        try:
+            # A copy rather than a hard link: tagging edits the file in place,
+            # which would otherwise reach back into the cache
+            shutil.copyfile(cached_file, output_file)
+        except FileNotFoundError:
+            continue
+        except OSError:
+            if os.path.exists(output_file):
+                os.remove(output_file)
+            return None
+        try:
+            os.utime(cached_file)
+        except OSError:
+            pass
+        return output_file
+    return None
+
+
+def store_cached_track(track_info, audio_format, quality, file_path):
+    """Keep an untagged copy of a fresh download for later runs."""
+    suffix = os.path.splitext(file_path)[1]
+    try:
+        TRACK_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        # Copy under a temporary name so a concurrent lookup never sees a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=TRACK_CACHE_DIR)
+        os.close(fd)
+    except OSError:
+        return
+    try:
+        shutil.copyfile(file_path, tmp_path)
+        os.replace(tmp_path, f"{track_cache_stem(track_info, audio_format, quality)}{suffix}")
+    except OSError:
+        # The temporary name has no cache suffix, so pruning would never remove it
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+# ---------------- yt-dlp ----------------
+_worker = threading.local()
+
+# Source searches started per second across all download workers and sessions
+SOURCE_LOOKUPS_PER_SECOND = 4
+
+
+class LookupLimiter:
+    """Hands out start times for source searches at a fixed rate."""
+
+    def __init__(self, per_second):
+        self.interval = 1 / per_second
+        self.lock = threading.Lock()
+        self.next_slot = 0.0
+
+    def wait(self):
+        """Block until the caller may start its next search."""
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        time.sleep(slot - now)
+
+
+@st.cache_resource(show_spinner=False)
+def get_lookup_limiter():
+    """Return the process-wide limiter, so its pacing survives reruns and spans sessions."""
+    return LookupLimiter(SOURCE_LOOKUPS_PER_SECOND)
+
+
+def wait_for_lookup_slot():
+    """Block until this worker may start its next source search.
+
+    Slots are handed out in order at a fixed rate shared by every worker, so
+    a large pool cannot burst requests at YouTube and get throttled with 403s.
+    """
+    get_lookup_limiter().wait()
+
+
+def build_ydl_opts(audio_format="m4a", quality="best", concurrent_fragments=4, use_aria2c=False):
+    """Build the yt-dlp options shared by every track in a download."""
+    # Format options
+    if audio_format == "m4a":
+        format_arg = "bestaudio[ext=m4a]/bestaudio/best"
+    elif audio_format == "mp3":
+        format_arg = "bestaudio/best"
+    else:
+        format_arg = "bestaudio/best"
+
+    extract_audio = {'key': 'FFmpegExtractAudio', 'preferredcodec': 'best'}
+
+    # Add post-processing for mp3
+    if audio_format == "mp3":
+        extract_audio.update({
+            'preferredcodec': 'mp3',
+            'preferredquality': quality if quality != "best" else "0"
+        })
+
+    opts = {
+        'format': format_arg,
+        'noplaylist': True,
+        'quiet': True,
+        'no_warnings': True,
+        'nocheckcertificate': True,
+        'socket_timeout': 30,
+        'retries': 3,
+        # Fetch DASH/HLS fragments of a single stream in parallel
+        'concurrent_fragment_downloads': concurrent_fragments,
+        'http_headers': {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'},
+        # Filter to avoid remixes and edits
+        'match_filter': match_filter_func('!is_live & !was_live'),
+        'default_search': 'ytsearch',
+        'extractor_args': {'soundcloud': {'client_id': ['']}},
+        'postprocessors': [extract_audio],
+        # Keep the signature/nsig cache warm between sessions
+        'cachedir': str(CACHE_DIR / "ytdlp"),
+        # Skip the utime call and the .part rename for every file
+        'updatetime': False,
+        'nopart': True,
+    }
+
+    # aria2c splits each download across many connections, which helps most on
+    # throttled streams
+    if use_aria2c:
+        opts['external_downloader'] = {'default': 'aria2c'}
+
+    return opts
+
+
+def stop_if_cancelled(ydl, progress):
+    """Progress hook that aborts the running download once its track is cancelled.
+
+    Hooks can run on fragment threads, so the event is read from the instance's
+    params (set per track) rather than from the calling thread.
+    """
+    cancel_event = ydl.params.get('cancel_event')
+    if cancel_event is not None and cancel_event.is_set():
+        raise DownloadCancelled("Download cancelled")
+
+
+def get_worker_ydl(audio_format="m4a", quality="best", concurrent_fragments=4, use_aria2c=False):
+    """Return this thread's YoutubeDL instance, creating it on first use.
+
+    Instances keep their extractors, cookies and connection pool warm across
+    tracks but are not safe to share between threads, so each download worker
+    gets its own.
+    """
+    key = (audio_format, quality, concurrent_fragments, use_aria2c)
+    if getattr(_worker, "key", None) != key:
+        if getattr(_worker, "ydl", None) is not None:
+            _worker.ydl.close()
+        _worker.ydl = YoutubeDL(build_ydl_opts(audio_format, quality, concurrent_fragments, use_aria2c))
+        _worker.ydl.add_progress_hook(partial(stop_if_cancelled, _worker.ydl))
+        _worker.key = key
+    return _worker.ydl
+
+
+def track_match_filter(track_info, tolerance_ms=10000):
+    """Build a yt-dlp match filter for one track.
+
+    Besides skipping live streams, it rejects videos whose length differs from
+    the Spotify track by more than ``tolerance_ms``, which weeds out extended
+    mixes, music videos with intros and other wrong matches.
+    """
+    live_filter = match_filter_func('!is_live & !was_live')
+    expected_ms = track_info.get("duration_ms")
+
+    def match_filter(info, *, incomplete=False):
+        duration = info.get("duration")
+        if expected_ms and duration and abs(duration * 1000 - expected_ms) > tolerance_ms:
+            return f"Duration {duration}s does not match the track"
+        return live_filter(info, incomplete=incomplete)
+
+    return match_filter
+
+
+def search_source(url, abandoned, audio_format="m4a", quality="best", concurrent_fragments=4, use_aria2c=False):
+    """Return the flat top result of a source search, or None if the track no longer needs it."""
+    wait_for_lookup_slot()
+    if abandoned.is_set():
+        return None
+    ydl = get_worker_ydl(audio_format, quality, concurrent_fragments, use_aria2c)
+    return first_entry(ydl.extract_info(url, download=False, process=False))
+
+
+def race_source_searches(search_executor, sources, match_filter, *ydl_args):
+    """Search several sources at once and yield each matching ``(source, entry)`` as it comes back."""
+    abandoned = threading.Event()
+    searches = {
+        search_executor.submit(search_source, source["url"], abandoned, *ydl_args): source
+        for source in sources
+    }
+    try:
+        for future in as_completed(searches):
+            try:
+                entry = future.result()
+            except Exception:
+                continue
+            if entry and (entry.get("webpage_url") or entry.get("url")) and match_filter(entry) is None:
+                yield searches[future], entry
+    finally:
+        abandoned.set()
+        for future in searches:
+            future.cancel()
+
+
+def first_entry(info):
+    """Return the video info from an extract_info result.
+
+    Search results wrap the matched video in a one-entry playlist; entries
+    rejected by the match filter are dropped, leaving None.
+    """
+    if not info:
+        return None
+    if info.get("_type") == "playlist" or "entries" in info:
+        return next((e for e in info.get("entries") or [] if e), None)
+    return info
+
+
+def downloaded_filepath(entry):
+    """Return the path of the file written for a downloaded video, or None."""
+    downloads = (entry or {}).get("requested_downloads") or []
+    return downloads[0].get("filepath") if downloads else None
+
+
 # ---------------- Multi-Source Download Function ----------------
-def download_track_multisource(track_info, output_dir, audio_format="m4a", quality="best"):
+def download_track_multisource(track_info, output_dir, audio_format="m4a", quality="best", concurrent_fragments=4,
+                               use_aria2c=False, log=None, existing_names=None, cancel_event=None,
+                               search_executor=None):
     """Download a single track using multiple sources."""
     track_name = track_info["name"]
     artist_name = track_info["artists"]
@@ -249,11 +804,17 @@ def download_track_multisource(track_info, output_dir, audio_format="m4a", quali
 
     # Check if already downloaded
     possible_extensions = ['m4a', 'mp3', 'webm', 'opus']
-    exists, existing_file = file_exists_in_dir(output_dir, safe_filename, possible_extensions)
+    exists, existing_file = file_exists_in_dir(output_dir, safe_filename, possible_extensions, existing_names)
     if exists:
         return True, existing_file, "Already downloaded"
 
-    output_template = os.path.join(output_dir, f"{safe_filename}.%(ext)s")
+    # An earlier run downloaded this track with the same settings
+    cached_file = copy_cached_track(track_info, audio_format, quality, os.path.join(output_dir, safe_filename))
+    if cached_file:
+        return True, cached_file, "Local cache"
+
+    # Escape '%' so track names are not read as output template fields
+    output_template = os.path.join(output_dir, f"{safe_filename.replace('%', '%%')}.%(ext)s")
 
     # Source configurations (in priority order)
     # Using filters to avoid remixes, slowed, reverb, sped up versions
@@ -261,145 +822,243 @@ def download_track_multisource(track_info, output_dir, audio_format="m4a", quali
         {
             "name": "YouTube Music (Official Audio)",
             "url": f"ytsearch1:{artist_name} - {track_name} official audio",
-            "extra_args": []
         },
         {
             "name": "YouTube (Topic Channel)",
             "url": f"ytsearch1:{artist_name} - {track_name} topic",
-            "extra_args": []
         },
         {
             "name": "YouTube (Provided to YouTube)",
             "url": f"ytsearch1:{artist_name} {track_name} provided to youtube",
-            "extra_args": []
         },
         {
             "name": "YouTube (Audio)",
             "url": f"ytsearch1:{artist_name} {track_name} audio",
-            "extra_args": []
         },
         {
             "name": "Soundcloud",
             "url": f"scsearch1:{artist_name} {track_name}",
-            "extra_args": ['--extractor-args', 'soundcloud:client_id=']
         }
     ]
 
-    # Format options
-    if audio_format == "m4a":
-        format_arg = "bestaudio[ext=m4a]/bestaudio/best"
-    elif audio_format == "mp3":
-        format_arg = "bestaudio/best"
-    else:
-        format_arg = "bestaudio/best"
+    # A previous run already found this track: try its URL before searching again
+    resolved = get_resolved_source(track_info)
+    if resolved:
+        sources.insert(0, {"name": f"{resolved[1]} (cached)", "url": resolved[0], "cached": True})
+
+    match_filter = track_match_filter(track_info)
+    ydl = get_worker_ydl(audio_format, quality, concurrent_fragments, use_aria2c)
+    ydl.params['outtmpl']['default'] = output_template
+    ydl.params['match_filter'] = match_filter
+    ydl.params['cancel_event'] = cancel_event
+
+    # (source, call, whether the call runs a search and needs a lookup slot)
+    attempts = [
+        (source, partial(ydl.extract_info, source["url"], download=True), not source.get("cached"))
+        for source in sources
+    ]
 
-    for source in sources:
-        try:
-            cmd = [
-                'yt-dlp',
-                '-f', format_arg,
-                '-o', output_template,
-                '--no-playlist',
-                '--quiet',
-                '--no-warnings',
-                '--extract-audio',
-                '--no-check-certificates',
-                '--socket-timeout', '30',
-                '--retries', '3',
-                '--user-agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                # Filter to avoid remixes and edits
-                '--match-filter', '!is_live & !was_live',
-                '--default-search', 'ytsearch',
-            ]
-
-            # Add source-specific args
-            cmd.extend(source["extra_args"])
-
-            # Add post-processing for mp3
-            if audio_format == "mp3":
-                cmd.extend([
-                    '--audio-format', 'mp3',
-                    '--audio-quality', quality if quality != "best" else "0"
-                ])
-
-            cmd.append(source["url"])
-
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=120
-            )
+    # Search the two preferred sources at once so one slow search does not hold
+    # up the other, then download their matches fastest first
+    racing = search_executor and not resolved and not (cancel_event and cancel_event.is_set())
+    if racing:
+        if log:
+            log(f"🔎 Searching {sources[0]['name']} and {sources[1]['name']}: {artist_name} - {track_name}")
+        attempts = attempts[2:]
+    hits = race_source_searches(search_executor, sources[:2] if racing else [], match_filter, audio_format,
+                                quality, concurrent_fragments, use_aria2c)
+    # The searches ran on other threads' instances; download each matched
+    # video by its URL on this worker's own instance
+    hit_attempts = (
+        (source, partial(ydl.extract_info, entry.get("webpage_url") or entry["url"], download=True), False)
+        for source, entry in hits
+    )
 
-            if result.returncode == 0:
-                # Find the downloaded file
-                exists, downloaded_file = file_exists_in_dir(output_dir, safe_filename, possible_extensions)
-                if exists:
-                    # Verify the file is not empty or corrupted
+    with closing(hits):
+        for source, attempt, searches in chain(hit_attempts, attempts):
+            if cancel_event and cancel_event.is_set():
+                return False, None, "Cancelled"
+            if log:
+                log(f"🔎 Trying {source['name']}: {artist_name} - {track_name}")
+            if searches:
+                wait_for_lookup_slot()
+            try:
+                entry = first_entry(attempt())
+
+                # yt-dlp reports the final path after post-processing
+                downloaded_file = downloaded_filepath(entry)
+                if downloaded_file:
+                    # Verify the file is not empty or corrupted; a missing file
+                    # raises OSError here and falls through to the next source
                     if os.path.getsize(downloaded_file) > 50000:  # At least 50KB
+                        if not source.get("cached") and entry.get("webpage_url"):
+                            store_resolved_source(track_info, entry["webpage_url"], source["name"])
+                        store_cached_track(track_info, audio_format, quality, downloaded_file)
                         return True, downloaded_file, source["name"]
                     else:
                         # File too small, might be corrupted, try next source
                         os.remove(downloaded_file)
 
-            # If failed, try next source
-            time.sleep(1)
-
-        except subprocess.TimeoutExpired:
-            continue
-        except Exception as e:
-            continue
+            except DownloadCancelled:
+                exists, partial_file = file_exists_in_dir(output_dir, safe_filename, possible_extensions)
+                if exists:
+                    os.remove(partial_file)
+                return False, None, "Cancelled"
+            except DownloadError:
+                # Without .part files an interrupted download keeps its final name,
+                # so clear it before the next source would treat it as finished
+                exists, partial_file = file_exists_in_dir(output_dir, safe_filename, possible_extensions)
+                if exists:
+                    os.remove(partial_file)
+                continue
+            except Exception as e:
+                continue
 
     return False, None, "All sources failed"
 
 
-def download_playlist_multisource(tracks, output_dir, audio_format="m4a", quality="best", add_metadata=True):
-    """Download multiple tracks with metadata from multiple sources."""
+def download_playlist_multisource(tracks, output_dir, audio_format="m4a", quality="best", add_metadata=True,
+                                  max_workers=8, concurrent_fragments=4, use_aria2c=False, downloaded_files=None,
+                                  cover_size=COVER_MAX_SIZE):
+    """Download multiple tracks concurrently with metadata from multiple sources.
+
+    Yields ``("log", message)`` status lines and, after each track finishes,
+    ``("progress", finished, total)``. If ``downloaded_files`` is a list, the
+    path of every track that ends up on disk is appended to it.
+    """
     downloaded = 0
     failed = []
     skipped = 0
 
-    for idx, track in enumerate(tracks, 1):
-        track_name = track["name"]
-        artist_name = track["artists"]
+    # Playlists can repeat a song; download each output file once. Key on the
+    # cleaned name the file is saved under, since tracks that differ only in
+    # stripped characters (e.g. "AC/DC" and "ACDC") would share one path
+    seen = set()
+    unique_tracks = []
+    for track in tracks:
+        key = clean_filename(f"{track['artists']} - {track['name']}")
+        if key not in seen:
+            seen.add(key)
+            unique_tracks.append(track)
+
+    if len(unique_tracks) < len(tracks):
+        yield "log", f"🔁 Skipping {len(tracks) - len(unique_tracks)} duplicate tracks"
+    tracks = unique_tracks
+
+    # Each download is network-bound and independent, so run them in parallel
+    # and report results from this thread as they complete. Workers push
+    # progress lines onto a queue that is drained between completions.
+    # Tagging runs on its own pool so it overlaps with the remaining downloads.
+    events = queue.Queue()
+    cancel_event = threading.Event()
+    # List the output directory once instead of probing it for every track
+    with os.scandir(output_dir) as it:
+        existing_names = {e.name for e in it}
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    # Each download races two source searches, so give every worker room for both
+    search_executor = ThreadPoolExecutor(max_workers=2 * max_workers)
+    tag_executor = ThreadPoolExecutor(max_workers=8)
+    pending = set()
+    try:
+        # Fetch each distinct album cover once, in parallel with the audio downloads;
+        # covers still being warmed from the Fetch step are joined, not refetched
+        cover_futures = {}
+        if add_metadata:
+            fetcher = get_cover_fetcher()
+            cover_urls = {t["cover_url"] for t in tracks if t.get("cover_url")}
+            cover_futures = {url: fetcher.fetch(url, cover_size) for url in cover_urls}
+
+        futures = {
+            executor.submit(
+                download_track_multisource, track, output_dir, audio_format, quality, concurrent_fragments,
+                use_aria2c, events.put, existing_names, cancel_event, search_executor
+            ): track
+            for track in tracks
+        }
+        tag_futures = {}
+
+        pending = set(futures)
+        finished = 0
+        while pending:
+            done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+
+            # Relay what the workers reported since the last pass
+            while not events.empty():
+                yield "log", events.get_nowait()
+
+            for future in done:
+                if future in tag_futures:
+                    track_name = tag_futures[future]["name"]
+                    try:
+                        tagged = future.result()
+                    except Exception:
+                        tagged = False
+
+                    if tagged:
+                        yield "log", f"✅ Metadata added: {track_name}"
+                    else:
+                        yield "log", f"⚠️  Metadata failed (file still usable): {track_name}"
+                    continue
 
-        yield f"[{idx}/{len(tracks)}] Processing: {artist_name} - {track_name}"
+                finished += 1
+                track = futures[future]
+                track_name = track["name"]
+                artist_name = track["artists"]
 
-        success, file_path, source = download_track_multisource(
-            track, output_dir, audio_format, quality
-        )
+                yield "log", f"[{finished}/{len(tracks)}] Finished: {artist_name} - {track_name}"
 
-        if success and file_path:
-            if source == "Already downloaded":
-                yield f"⏭️  Skipped (already exists): {track_name}"
-                skipped += 1
-            else:
-                yield f"✅ Downloaded from {source}: {track_name}"
+                try:
+                    success, file_path, source = future.result()
+                except Exception as e:
+                    success, file_path, source = False, None, str(e)
 
-                # Add metadata and cover art
-                if add_metadata:
-                    yield f"🎨 Adding album cover and metadata..."
-                    cover_data = None
-                    if track.get("cover_url"):
-                        cover_data = download_cover_art(track["cover_url"])
+                if success and file_path:
+                    existing_names.add(os.path.basename(file_path))
+                    if downloaded_files is not None:
+                        downloaded_files.append(Path(file_path))
 
-                    if add_metadata_to_file(file_path, track, cover_data):
-                        yield f"✅ Metadata added"
+                    if source == "Already downloaded":
+                        yield "log", f"⏭️  Skipped (already exists): {track_name}"
+                        skipped += 1
                     else:
-                        yield f"⚠️  Metadata failed (file still usable)"
-
-                downloaded += 1
-        else:
-            yield f"❌ Failed: {track_name} - {source}"
-            failed.append(f"{artist_name} - {track_name}")
-
-        yield f"Progress: {downloaded}/{len(tracks)} downloaded, {skipped} skipped"
-
-    yield f"\n🎉 Complete! {downloaded}/{len(tracks)} downloaded, {skipped} skipped"
+                        yield "log", f"✅ Downloaded from {source}: {track_name}"
+
+                        # Add metadata and cover art
+                        if add_metadata:
+                            yield "log", f"🎨 Adding album cover and metadata..."
+                            tag_future = tag_executor.submit(
+                                tag_track, file_path, track, cover_futures.get(track.get("cover_url"))
+                            )
+                            tag_futures[tag_future] = track
+                            pending.add(tag_future)
+
+                        downloaded += 1
+                else:
+                    yield "log", f"❌ Failed: {track_name} - {source}"
+                    failed.append(f"{artist_name} - {track_name}")
+
+                yield "progress", finished, len(tracks)
+                yield "log", f"Progress: {downloaded}/{len(tracks)} downloaded, {skipped} skipped"
+    finally:
+        stopped_early = bool(pending)
+        if stopped_early:
+            # The caller stopped early (e.g. a Streamlit rerun interrupted the
+            # download): native downloads abort at their next progress update
+            # (aria2c only reports when it finishes) and queued work is
+            # dropped, so don't wait for the pools to drain
+            cancel_event.set()
+        for pool in (executor, search_executor, tag_executor):
+            pool.shutdown(wait=not stopped_early, cancel_futures=stopped_early)
+
+    prune_cache_dir(TRACK_CACHE_DIR, TRACK_CACHE_MAX_BYTES, TRACK_CACHE_SUFFIXES)
+    if add_metadata:
+        prune_cache_dir(COVER_CACHE_DIR, COVER_CACHE_MAX_BYTES, (".jpg",))
+
+    yield "log", f"\n🎉 Complete! {downloaded}/{len(tracks)} downloaded, {skipped} skipped"
     if failed:
-        yield f"⚠️  Failed tracks ({len(failed)}): " + ", ".join(failed[:5])
+        yield "log", f"⚠️  Failed tracks ({len(failed)}): " + ", ".join(failed[:5])
         if len(failed) > 5:
-            yield f"   ... and {len(failed) - 5} more"
+            yield "log", f"   ... and {len(failed) - 5} more"
 
 
 # ---------------- Session State ----------------
@@ -410,13 +1069,30 @@ if "playlist_name" not in st.session_state:
 if "content_type" not in st.session_state:
     st.session_state.content_type = ""
 if "logs" not in st.session_state:
-    st.session_state.logs = []
+    st.session_state.logs = deque(maxlen=50)
+if "logs_flushed_at" not in st.session_state:
+    st.session_state.logs_flushed_at = 0.0
+if "progress" not in st.session_state:
+    st.session_state.progress = 0.0
+
+LOG_FLUSH_INTERVAL = 0.2  # seconds between log and progress re-renders
+
+
+def flush_log():
+    st.session_state.logs_flushed_at = time.monotonic()
+    log_area.text("\n".join(st.session_state.logs))
+    progress_bar.progress(st.session_state.progress)
 
 
 def append_log(msg):
+    # Re-render at most every LOG_FLUSH_INTERVAL; flush_log() shows the tail at the end
     st.session_state.logs.append(msg)
-    log_area.text("\n".join(st.session_state.logs[-50:]))
+    if time.monotonic() - st.session_state.logs_flushed_at >= LOG_FLUSH_INTERVAL:
+        flush_log()
+
 
+if st.session_state.pop("download_cancelled", False):
+    st.info("⏹️ Download cancelled.")
 
 # ---------------- Fetch Button ----------------
 if fetch_btn:
@@ -440,13 +1116,15 @@ if fetch_btn:
                 st.session_state.playlist_name = playlist_data.get('name', 'playlist')
                 st.session_state.content_type = "playlist"
 
+                if add_metadata:
+                    warm_cover_cache(tracks, cover_size)
+
                 if tracks:
                     st.success(f"✅ Found {len(tracks)} tracks in playlist")
 
                     # Display tracks
-                    df = pd.DataFrame(tracks)
                     st.dataframe(
-                        df[["name", "artists", "album"]],
+                        tracks_for_display(tracks),
                         use_container_width=True,
                         height=400
                     )
@@ -465,12 +1143,14 @@ if fetch_btn:
                 st.session_state.playlist_name = f"{track_info['artists']} - {track_info['name']}"
                 st.session_state.content_type = "track"
 
+                if add_metadata:
+                    warm_cover_cache([track_info], cover_size)
+
                 st.success(f"✅ Track found")
 
                 # Display track
-                df = pd.DataFrame([track_info])
                 st.dataframe(
-                    df[["name", "artists", "album"]],
+                    tracks_for_display([track_info]),
                     use_container_width=True
                 )
 
@@ -492,45 +1172,56 @@ if download_btn:
     elif not st.session_state.playlist_tracks:
         st.warning("Please fetch the playlist/track first by clicking 'Fetch Info'")
     else:
-        st.session_state.logs = []
+        st.session_state.logs = deque(maxlen=50)
+        st.session_state.progress = 0.0
+        status = status_text.status("Downloading songs with album covers...", expanded=True)
+        with status:
+            log_area = st.empty()
+            progress_bar = st.progress(0.0)
         append_log("🚀 Starting download process...")
 
         # Create temporary directory for downloads
         temp_dir = tempfile.mkdtemp()
+        # Any click reruns the script, which interrupts the loop below; closing
+        # the generator then cancels the tracks that have not finished
+        cancel_area = st.empty()
+        cancel_area.button("⏹️ Cancel download", key="cancel_download")
+        interrupted = True
 
         try:
             # Download using multi-source approach
             append_log(f"📥 Downloading (tries: YouTube Music → YouTube → Soundcloud)...")
-            status_text.text("Downloading songs with album covers...")
 
-            download_count = 0
-            total_tracks = len(st.session_state.playlist_tracks)
+            downloaded_files = []
 
-            for output in download_playlist_multisource(
+            with closing(download_playlist_multisource(
                     st.session_state.playlist_tracks,
                     temp_dir,
                     audio_format,
                     audio_quality,
-                    add_metadata
-            ):
-                append_log(output)
-                if "✅ Downloaded from" in output:
-                    download_count += 1
-                    progress_bar.progress(min(download_count / max(total_tracks, 1), 1.0))
-
-            # Check if files were downloaded
-            downloaded_files = []
-            for ext in ['m4a', 'mp3', 'webm', 'opus']:
-                downloaded_files.extend(list(Path(temp_dir).glob(f"*.{ext}")))
+                    add_metadata,
+                    max_workers,
+                    concurrent_fragments,
+                    use_aria2c,
+                    downloaded_files,
+                    cover_size
+            )) as download_events:
+                for kind, *payload in download_events:
+                    if kind == "progress":
+                        finished, total = payload
+                        # The progress bar is re-rendered together with the log
+                        st.session_state.progress = finished / max(total, 1)
+                    else:
+                        append_log(payload[0])
+            interrupted = False
+            cancel_area.empty()
+            status.update(label="Download finished", state="complete")
 
             # Remove duplicates based on filename (keep first occurrence)
-            seen = set()
-            unique_files = []
+            files_by_stem = {}
             for f in downloaded_files:
-                base_name = f.stem
-                if base_name not in seen:
-                    seen.add(base_name)
-                    unique_files.append(f)
+                files_by_stem.setdefault(f.stem, f)
+            unique_files = list(files_by_stem.values())
 
             if unique_files:
                 append_log(f"\n✅ Successfully downloaded {len(unique_files)} unique songs with metadata")
@@ -538,53 +1229,56 @@ if download_btn:
                 # For single track, provide direct download
                 if st.session_state.content_type == "track" and len(unique_files) == 1:
                     file_path = unique_files[0]
-                    with open(file_path, 'rb') as f:
-                        file_data = f.read()
 
                     st.success(f"🎉 Downloaded song with album cover!")
 
-                    st.download_button(
-                        label=f"📥 Download {file_path.name}",
-                        data=file_data,
-                        file_name=file_path.name,
-                        mime="audio/mpeg" if file_path.suffix == ".mp3" else "audio/mp4",
-                        use_container_width=True
-                    )
+                    with open(file_path, 'rb') as file_data:
+                        st.download_button(
+                            label=f"📥 Download {file_path.name}",
+                            data=file_data,
+                            file_name=file_path.name,
+                            mime="audio/mpeg" if file_path.suffix == ".mp3" else "audio/mp4",
+                            use_container_width=True
+                        )
 
                 else:
                     # Create ZIP file for multiple tracks
                     append_log("📦 Creating ZIP file...")
-                    zip_buffer = BytesIO()
-
-                    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                        for file_path in unique_files:
-                            zip_file.write(file_path, file_path.name)
-
-                    zip_buffer.seek(0)
 
                     # Clean playlist name for filename
-                    playlist_name_safe = "".join(
-                        c for c in st.session_state.playlist_name if c.isalnum() or c in (' ', '-', '_'))
+                    playlist_name_safe = _UNSAFE_ARCHIVE_CHARS_RE.sub('', st.session_state.playlist_name)
                     if not playlist_name_safe:
                         playlist_name_safe = "playlist"
                     zip_filename = f"{playlist_name_safe}_songs.zip"
 
+                    # Write the archive next to the songs instead of into memory. Audio is
+                    # already compressed, so entries are stored unless asked otherwise.
+                    zip_path = os.path.join(temp_dir, zip_filename)
+                    compression = zipfile.ZIP_DEFLATED if compress_zip else zipfile.ZIP_STORED
+                    with zipfile.ZipFile(zip_path, 'w', compression, allowZip64=True) as zip_file:
+                        for file_path in unique_files:
+                            write_zip_entry(zip_file, file_path, file_path.name)
+
                     st.success(f"🎉 Downloaded {len(unique_files)} songs with album covers!")
 
                     # Download button
-                    st.download_button(
-                        label=f"📦 Download ZIP File ({len(unique_files)} songs)",
-                        data=zip_buffer.getvalue(),
-                        file_name=zip_filename,
-                        mime="application/zip",
-                        use_container_width=True
-                    )
+                    with open(zip_path, 'rb') as zip_data:
+                        st.download_button(
+                            label=f"📦 Download ZIP File ({len(unique_files)} songs)",
+                            data=zip_data,
+                            file_name=zip_filename,
+                            mime="application/zip",
+                            use_container_width=True
+                        )
 
                 st.info(f"💾 Click the button above to download")
             else:
                 st.error("❌ No songs were downloaded. Check the logs above for errors.")
 
         except Exception as e:
+            interrupted = False
+            cancel_area.empty()
+            status.update(label="Download failed", state="error")
             st.error(f"❌ Error during download: {e}")
             append_log(f"Error: {str(e)}")
 
@@ -595,7 +1289,12 @@ if download_btn:
             except:
                 pass
 
-            progress_bar.progress(1.0)
+            if interrupted:
+                # Reported by the rerun that stopped this one
+                st.session_state.download_cancelled = True
+            else:
+                st.session_state.progress = 1.0
+                flush_log()
 
 # ---------------- Help Section ----------------
 